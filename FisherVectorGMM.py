@@ -0,0 +1,255 @@
+import numpy as np
+from numba import njit, prange
+from sklearn.mixture import GaussianMixture
+
+try:
+    import cupy as cp
+except ImportError:
+    cp = None  # cupy is optional: without it the fisher vectors are always computed on CPU
+
+
+@njit(cache=True, parallel=True, fastmath=True, boundscheck=False)
+def _fv_acc(descriptors, posteriors, means, inv_variances, out):
+    """
+    Accumulate in out (n_images, 2 * n_kernels, n_features), initialized to zero, the deviations of the descriptors
+    (n_images, n_descriptors, n_features) from the means (first n_kernels rows) and from the variances
+    (last n_kernels rows) of the kernels weighted by the posteriors (n_images, n_descriptors, n_kernels)
+    """
+
+    n_images, n_descriptors, n_features = descriptors.shape
+    n_kernels = means.shape[0]
+    for k in prange(n_kernels):
+        for i in range(n_images):
+            for m in range(n_descriptors):
+                posterior = posteriors[i, m, k]
+                for d in range(n_features):
+                    dev = (descriptors[i, m, d] - means[k, d]) * inv_variances[k, d]
+                    out[i, k, d] += posterior * dev
+                    out[i, n_kernels + k, d] += posterior * (dev * dev - 1)
+
+
+@njit(cache=True, parallel=True, fastmath=True, boundscheck=False)
+def _fv_acc_diag(descriptors, means, inv_variances, log_norm, log_weights, out, block_size):
+    """
+    Accumulate in out (n_images, 2 * n_kernels, n_features), initialized to zero, the deviations of the descriptors
+    (n_images, n_descriptors, n_features) from the means and from the variances of the kernels of a GMM with diagonal
+    covariances weighted by their posteriors.
+    The images are processed in blocks of block_size: the posteriors of the descriptors of a block are computed
+    (normalizing the weighted log-likelihoods with the log-sum-exp trick) in a local buffer and used right after,
+    so that descriptors, means and inverse variances are reused from cache
+    """
+
+    n_images, n_descriptors, n_features = descriptors.shape
+    n_kernels = means.shape[0]
+    n_blocks = (n_images + block_size - 1) // block_size
+    for b in prange(n_blocks):
+        start = b * block_size
+        end = min(start + block_size, n_images)
+        posteriors = np.empty(shape=(end - start, n_descriptors, n_kernels))
+        for i in range(start, end):
+            for m in range(n_descriptors):
+                max_log_prob = 0.0
+                for k in range(n_kernels):
+                    log_prob = log_norm[k] + log_weights[k]
+                    for d in range(n_features):
+                        diff = descriptors[i, m, d] - means[k, d]
+                        log_prob -= 0.5 * diff * diff * inv_variances[k, d]
+                    posteriors[i - start, m, k] = log_prob
+                    if k == 0 or log_prob > max_log_prob:
+                        max_log_prob = log_prob
+                sum_prob = 0.0
+                for k in range(n_kernels):
+                    posteriors[i - start, m, k] = np.exp(posteriors[i - start, m, k] - max_log_prob)
+                    sum_prob += posteriors[i - start, m, k]
+                for k in range(n_kernels):
+                    posteriors[i - start, m, k] /= sum_prob
+        for i in range(start, end):
+            for m in range(n_descriptors):
+                for k in range(n_kernels):
+                    posterior = posteriors[i - start, m, k]
+                    for d in range(n_features):
+                        dev = (descriptors[i, m, d] - means[k, d]) * inv_variances[k, d]
+                        out[i, k, d] += posterior * dev
+                        out[i, n_kernels + k, d] += posterior * (dev * dev - 1)
+
+
+class FisherVectorGMM:
+    """Gaussian Mixture fitted on the descriptors of the frames and used to encode them as fisher vectors. """
+
+    def __init__(self, n_kernels=1, covariance_type='diag'):
+        assert covariance_type in ['diag', 'full']
+        assert n_kernels > 0
+        self.n_kernels = n_kernels  # Number of kernels of the GMM
+        self.covariance_type = covariance_type  # type of the covariance matrix of the GMM
+        self.gmm = None  # GaussianMixture of sklearn fitted on the descriptors
+        self.means = None  # means of the kernels of the GMM (n_kernels, n_features)
+        self.covars = None  # covariances of the kernels of the GMM (as returned by sklearn for the covariance type)
+        self.weights = None  # weights of the kernels of the GMM (n_kernels)
+
+    def __new_gmm(self, n_kernels):
+        """
+        Return a GaussianMixture (not fitted) with the given number of kernels
+        """
+
+        return GaussianMixture(n_components=n_kernels, covariance_type=self.covariance_type, max_iter=1000)
+
+    def __fit_gmm(self, descriptors, n_kernels):
+        """
+        Fit a GaussianMixture with the given number of kernels on a 2D array of descriptors.
+        Return the fitted GaussianMixture
+        """
+
+        return self.__new_gmm(n_kernels).fit(descriptors)
+
+    def get_fit_params(self):
+        """
+        Return a dict with the parameters of the GaussianMixture fitted for each number of kernels (except the number
+        of kernels)
+        """
+
+        fit_params = self.__new_gmm(1).get_params()
+        del fit_params['n_components']
+        return fit_params
+
+    def __set_gmm(self, gmm):
+        self.gmm = gmm
+        self.n_kernels = gmm.n_components
+        self.means = gmm.means_
+        self.covars = gmm.covariances_
+        self.weights = gmm.weights_
+
+    def __variances(self):
+        """
+        Return the variances (diagonals of the covariance matrices) of the kernels of the GMM
+        """
+
+        if self.covariance_type == 'diag':
+            return self.covars
+        return np.diagonal(self.covars, axis1=1, axis2=2)
+
+    def __posteriors(self, descriptors):
+        """
+        Compute the posteriors of the kernels for a 2D array of descriptors giving the same weight to all the kernels
+        (likelihood ratio).
+        Return a 2D array (n_descriptors, n_kernels) with the posteriors
+        """
+
+        posteriors = self.gmm.predict_proba(descriptors) / self.weights
+        return posteriors / posteriors.sum(axis=1, keepdims=True)
+
+    def __use_gpu(self):
+        """
+        Return True if the fisher vectors can be computed on a CUDA device (only for diagonal covariances)
+        """
+
+        return cp is not None and self.covariance_type == 'diag' and cp.cuda.is_available()
+
+    def __accumulate_fv(self, descriptors, dtype):
+        """
+        Compute on CPU the deviations from the means and the variances of the kernels (not yet scaled by the weights)
+        of the descriptors (n_images, n_descriptors, n_features).
+        Return an array (n_images, 2 * n_kernels, n_features) of type dtype
+        """
+
+        n_images, n_descriptors, n_features = descriptors.shape
+        fisher_vectors = np.zeros(shape=(n_images, 2 * self.n_kernels, n_features), dtype=dtype)
+        if self.covariance_type == 'diag':
+            # Posteriors are computed giving the same weight to all the kernels (likelihood ratio)
+            log_norm = -0.5 * (n_features * np.log(2 * np.pi) + np.log(self.covars).sum(axis=1))
+            log_weights = np.full(self.n_kernels, -np.log(self.n_kernels))
+            _fv_acc_diag(descriptors, self.means, 1 / self.covars, log_norm, log_weights, fisher_vectors, 512)
+        else:
+            posteriors = self.__posteriors(descriptors.reshape(-1, n_features))
+            posteriors = posteriors.reshape(n_images, n_descriptors, self.n_kernels)
+            _fv_acc(descriptors, posteriors, self.means, 1 / self.__variances(), fisher_vectors)
+        return fisher_vectors
+
+    def __accumulate_fv_gpu(self, descriptors, dtype, block_size=8192):
+        """
+        Compute on the CUDA device the deviations from the means and the variances of the kernels (not yet scaled by
+        the weights) of the descriptors (n_images, n_descriptors, n_features), processing block_size images at a time.
+        Return an array (n_images, 2 * n_kernels, n_features) of type dtype
+        """
+
+        n_images, n_descriptors, n_features = descriptors.shape
+        means = cp.asarray(self.means, dtype=cp.float32)
+        inv_variances = cp.asarray(1 / self.covars, dtype=cp.float32)
+        log_norm = cp.asarray(-0.5 * (n_features * np.log(2 * np.pi) + np.log(self.covars).sum(axis=1)),
+                              dtype=cp.float32)
+        fisher_vectors = cp.empty(shape=(n_images, 2 * self.n_kernels, n_features), dtype=dtype)
+        for start in range(0, n_images, block_size):
+            end = min(start + block_size, n_images)
+            block = cp.asarray(descriptors[start:end].reshape(-1, n_features), dtype=cp.float32)
+            diff = block[:, None, :] - means[None, :, :]
+            # The weights of the kernels are the same for all the kernels (likelihood ratio) so they are not added
+            log_prob = log_norm - 0.5 * (diff * diff * inv_variances).sum(axis=2)
+            posteriors = cp.exp(log_prob - log_prob.max(axis=1, keepdims=True))
+            posteriors /= posteriors.sum(axis=1, keepdims=True)
+            norm_dev_from_modes = diff * inv_variances
+            posteriors = posteriors.reshape(end - start, n_descriptors, self.n_kernels)
+            norm_dev_from_modes = norm_dev_from_modes.reshape(end - start, n_descriptors, self.n_kernels, n_features)
+            fisher_vectors[start:end, :self.n_kernels] = cp.einsum('imk,imkd->ikd', posteriors, norm_dev_from_modes)
+            fisher_vectors[start:end, self.n_kernels:] = cp.einsum('imk,imkd->ikd', posteriors,
+                                                                   norm_dev_from_modes ** 2 - 1)
+        return cp.asnumpy(fisher_vectors)
+
+    def fit(self, X, verbose=True):
+        """
+        Fit the GMM on X: a ndarray with 4 dimensions (n_videos, n_frames, n_descriptors_per_image, n_features)
+        or with 3 dimensions (n_images, n_descriptors_per_image, n_features).
+        Return the fitted object
+        """
+
+        assert X.ndim in [3, 4], "X must be an ndarray with 3 or 4 dimensions"
+        self.__set_gmm(self.__fit_gmm(X.reshape(-1, X.shape[-1]), self.n_kernels))
+        if verbose:
+            print("fitted GMM with %i kernels" % self.n_kernels)
+        return self
+
+    def fit_by_bic(self, X, choices_n_kernels, verbose=True):
+        """
+        Fit a GMM for each number of kernels in choices_n_kernels and keep the one with the lowest BIC.
+        X has the same shape accepted by fit.
+        Return the fitted object
+        """
+
+        assert X.ndim in [3, 4], "X must be an ndarray with 3 or 4 dimensions"
+        descriptors = X.reshape(-1, X.shape[-1])
+        best_gmm, best_bic_score = None, np.inf
+        for n_kernels in choices_n_kernels:
+            gmm = self.__fit_gmm(descriptors, n_kernels)
+            bic_score = gmm.bic(descriptors)
+            if verbose:
+                print("fitted GMM with %i kernels - BIC = %.4f" % (n_kernels, bic_score))
+            if bic_score < best_bic_score:
+                best_gmm, best_bic_score = gmm, bic_score
+        self.__set_gmm(best_gmm)
+        if verbose:
+            print("Selected GMM with %i kernels" % self.n_kernels)
+        return self
+
+    def predict(self, X, normalized=True, dtype=np.float64):
+        """
+        Compute the (improved) fisher vectors of X, with the same shape accepted by fit, as an array of type dtype.
+        The fisher vector of each image contains the deviations from the means (first n_kernels rows)
+        and from the covariances (last n_kernels rows) of the kernels.
+        Return an array of shape (n_videos, n_frames, 2 * n_kernels, n_features) if X has 4 dimensions,
+        (n_images, 2 * n_kernels, n_features) if X has 3 dimensions
+        """
+
+        assert self.gmm is not None, "Model (GMM) must be fitted"
+        assert X.ndim in [3, 4], "X must be an ndarray with 3 or 4 dimensions"
+        assert X.shape[-1] == self.means.shape[1], "Features must have same dimensionality as fitted GMM"
+        n_descriptors, n_features = X.shape[-2], X.shape[-1]
+        descriptors = np.ascontiguousarray(X.reshape(-1, n_descriptors, n_features))
+        if self.__use_gpu():
+            fisher_vectors = self.__accumulate_fv_gpu(descriptors, dtype)
+        else:
+            fisher_vectors = self.__accumulate_fv(descriptors, dtype)
+        fisher_vectors[:, :self.n_kernels] /= n_descriptors * np.sqrt(self.weights)[:, None]
+        fisher_vectors[:, self.n_kernels:] /= n_descriptors * np.sqrt(2 * self.weights)[:, None]
+        if normalized:
+            fisher_vectors = np.sqrt(np.abs(fisher_vectors)) * np.sign(fisher_vectors)
+            fisher_vectors /= np.linalg.norm(fisher_vectors, axis=(1, 2))[:, None, None]
+        fisher_vectors[fisher_vectors < 10 ** -4] = 0
+        return fisher_vectors.reshape(X.shape[:-2] + fisher_vectors.shape[1:])
@@ -1,85 +1,248 @@
+import hashlib
+import multiprocessing
+import os
 import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import joblib
 import numpy as np
 import pandas as pd
-from fishervector import FisherVectorGMM
+from FisherVectorGMM import FisherVectorGMM
+from numba import njit, prange
 from sklearn.preprocessing import RobustScaler
-import matplotlib.pyplot as plt
-import matplotlib
 
-matplotlib.use('Agg')
+_CACHE_VERSION = 2  # version of the content of the cache (to increase when the code computing it changes)
+_histogram_figure = None  # figure and axes reused by each process to plot the histograms
 
 
+def _render_one(args):
+    """
+    Plot and save the histogram of a video by distinguishing the color of the representations of the relevant
+    configurations from the neutral ones. Executed by the workers of the pool used to plot the histograms
+    """
+
+    global _histogram_figure
+    idx, histo, index_neutral_configurations, index_relevant_configurations, path = args
+    if _histogram_figure is None:
+        # matplotlib is imported only by the processes that plot the histograms
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        _histogram_figure = plt.subplots()
+    fig, ax = _histogram_figure
+    ax.clear()
+    if len(index_neutral_configurations):
+        ax.bar(index_neutral_configurations, histo[np.array(index_neutral_configurations)], color="blue")
+    if len(index_relevant_configurations):
+        ax.bar(index_relevant_configurations, histo[np.array(index_relevant_configurations)], color="red")
+    ax.set_title("VIDEO #" + str(idx))
+    fig.savefig(path, dpi=200)
+
+
+@njit(cache=True, parallel=True, fastmath=True)
+def _velocities_kernel(coords, seq_starts, seq_ends, sel_idx_x, sel_idx_y, nose_tip_idx_x, nose_tip_idx_y, out,
+                       out_starts):
+    """
+    Compute the velocities of the selected landmarks (centered on the nose tip) of the frames of each sequence.
+    The first velocity of each sequence is skipped. The velocities of the sequence s are written in the rows of out
+    starting from out_starts[s].
+    The differences are computed on the float64 coordinates and only the resulting velocities are stored in out
+    """
+
+    for s in prange(seq_starts.shape[0]):
+        out_frame = out_starts[s]
+        for f in range(seq_starts[s] + 1, seq_ends[s] - 1):
+            nose_tip_dx = coords[f + 1, nose_tip_idx_x] - coords[f, nose_tip_idx_x]
+            nose_tip_dy = coords[f + 1, nose_tip_idx_y] - coords[f, nose_tip_idx_y]
+            for j in range(sel_idx_x.shape[0]):
+                dx = coords[f + 1, sel_idx_x[j]] - coords[f, sel_idx_x[j]] - nose_tip_dx
+                dy = coords[f + 1, sel_idx_y[j]] - coords[f, sel_idx_y[j]] - nose_tip_dy
+                out[out_frame, j] = np.sqrt(dx * dx + dy * dy)
+            out_frame += 1
+
 
 class PreliminaryClustering:
     """Class that is responsible for obtaining the relevant configurations for the classification of the VAS index. """
 
     def __init__(self, coord_df_path, seq_df_path, num_lndks, selected_lndks_idx, train_video_idx, n_kernels,
-                 threshold_neutral, covariance_type='diag', verbose=True, fit_by_bic=False):
+                 threshold_neutral, covariance_type='diag', verbose=True, fit_by_bic=False, cache_dir=None):
         self.coord_df_path = coord_df_path  # Path of csv file contained coordinates of the landmarks
         self.seq_df_path = seq_df_path  # Path of csv file contained sequences informations
         self.num_lndks = num_lndks  # Number of landmarks for each frame of the videos in the dataset
         self.selected_lndks_idx = selected_lndks_idx  # Indexes of the landmarks to considered to the clustering
+        self._sel_idx = np.asarray(selected_lndks_idx, dtype=np.int32)  # columns of x coordinates of selected landmarks
+        self._sel_idx_y = self._sel_idx + num_lndks  # columns of y coordinates of selected landmarks
         self.train_video_idx = train_video_idx  # Indexes of the videos to use for training
         self.fit_by_bic = fit_by_bic  # Define if the GMM must be fitted using fit by bic
         self.threshold_neutral = threshold_neutral  # Thresholds to use fo extraction of the neutral configurations
         self.n_kernels = n_kernels  # Number of kernels of the gmm to trained
         self.covariance_type = covariance_type  # type of the covariance matrix to use for the GMM fitting
         self.verbose = verbose  # define if the output must be printed in the class
-        self.gmm = None  # GMM fitted using fisherVector module on the training features
-        self.fisher_vectors = None  # FV of the frames contained in dataset
+        self.cache_dir = cache_dir  # directory where scaled velocities and GMM are cached (None to disable the cache)
+        self.gmm = None  # GMM (FisherVectorGMM) fitted on the training features
+        self._vel_flat = None  # velocities of the frames of all sequences in dataset (contiguous float32 2D array)
+        self._vel_offsets = None  # offsets of the frames of each sequence in the rows of _vel_flat and _fv_flat
+        self._fv_flat = None  # FV of the frames of all sequences in dataset (contiguous float32 3D array)
         self.histograms_of_videos = None  # histograms of all sequences contained in dataset
         self.index_relevant_configurations = None  # indexes of the clusters to considered as relevant
         self.index_neutral_configurations = None  # indexes of the clusters to considered as neutral (not to use for VAS classification)
+        self._coord_df = self.__read_csv_by_parquet(coord_df_path, dtype=np.float64)  # landmarks coordinates of the frames
+        self._seq_df = self.__read_csv_by_parquet(seq_df_path)  # informations of the sequences
+
+    def __getstate__(self):
+        # The coordinates of the landmarks are not dumped with the results of the clustering, FV and histograms are
+        # dumped in half precision
+        state = self.__dict__.copy()
+        state['_coord_df'] = None
+        if self._fv_flat is not None:
+            state['_fv_flat'] = self._fv_flat.astype(np.float16)
+        if self.histograms_of_videos is not None:
+            state['histograms_of_videos'] = [histogram.astype(np.float16) for histogram in self.histograms_of_videos]
+        return state
+
+    def __setstate__(self, state):
+        # FV and histograms dumped in half precision are loaded in single precision for the following computations
+        self.__dict__.update(state)
+        if self._fv_flat is not None:
+            self._fv_flat = self._fv_flat.astype(np.float32)
+        if self.histograms_of_videos is not None:
+            self.histograms_of_videos = [histogram.astype(np.float32) for histogram in self.histograms_of_videos]
+
+    @property
+    def fisher_vectors(self):
+        """
+        FV of the frames contained in dataset.
+        Return a list with a view (1, n_frames, 2 * n_kernels, n_features) on the FV of the frames of each sequence
+        """
+
+        if self._fv_flat is None:
+            return None
+        return [self._fv_flat[None, start:end] for start, end in zip(self._vel_offsets[:-1], self._vel_offsets[1:])]
+
+    @staticmethod
+    def __read_csv_by_parquet(csv_path, dtype=None):
+        """
+        Read a csv file of the dataset passing through a parquet copy saved next to it.
+        The parquet file is generated at the first reading (or when the csv is modified) so that the following
+        readings avoid parsing the text of the csv. The dtype used to read the csv is part of the name of the parquet
+        file, so a copy saved with a different dtype is never reused.
+        Return the dataframe read
+        """
+
+        parquet_path = os.path.splitext(csv_path)[0]
+        if dtype is not None:
+            parquet_path += "_" + np.dtype(dtype).name
+        parquet_path += ".parquet"
+        if os.path.isfile(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path):
+            return pd.read_parquet(parquet_path, engine='pyarrow')
+        df = pd.read_csv(csv_path, dtype=dtype, engine='c')
+        # The copy is written atomically: a partial parquet file newer than the csv would break every later reading
+        PreliminaryClustering.__write_cache_file(
+            parquet_path, lambda f: df.to_parquet(f, engine='pyarrow', compression='zstd'))
+        return df
+
+    @staticmethod
+    def __hash_file(file_path):
+        """
+        Return the hexadecimal digest of the content of a file
+        """
+
+        file_hash = hashlib.blake2b()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
+
+    @staticmethod
+    def __write_cache_file(cache_path, write):
+        """
+        Write a file of the cache calling write on a temporary file of the same directory, which is moved to
+        cache_path only once it is complete: an interrupted execution never leaves a truncated file in the cache
+        """
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def __get_cache_keys(self):
+        """
+        Compute the keys identifying in the cache the scaled velocities and the GMM.
+        The velocities depend on the dataset, on the selected landmarks and on the training videos and the parameters
+        of the scaler, the GMM also on the parameters used to fit it. Both keys contain _CACHE_VERSION, so the entries
+        saved by a previous version of the code are not reused.
+        Return the keys of the velocities and of the GMM
+        """
+
+        vel_key = "|".join([str(_CACHE_VERSION), self.__hash_file(self.coord_df_path),
+                            self.__hash_file(self.seq_df_path), str(self.num_lndks), str(self._sel_idx.tolist()),
+                            str([int(idx) for idx in self.train_video_idx]),
+                            str(sorted(self.__new_scaler().get_params().items()))])
+        vel_key = hashlib.blake2b(vel_key.encode()).hexdigest()[:16]
+        gmm_fit_params = FisherVectorGMM(covariance_type=self.covariance_type).get_fit_params()
+        gmm_key = "|".join([str(_CACHE_VERSION), vel_key, str(self.n_kernels), self.covariance_type,
+                            str(self.fit_by_bic), str(sorted(gmm_fit_params.items()))])
+        gmm_key = hashlib.blake2b(gmm_key.encode()).hexdigest()[:16]
+        return vel_key, gmm_key
 
     def __get_velocities_frames(self):
         """
         Extract velocities of landmarks video sequences in dataset.
-        Return a list of 2D array with velocities of the landmarks for each frame
+        Return a 2D array with velocities of the landmarks for each frame of all sequences and the offsets of the
+        frames of each sequence in its rows
         """
 
         if self.verbose:
             print("---- Calculating velocities of the frames in dataset... ----")
-        coord_df = pd.read_csv(self.coord_df_path)
-        seq_df = pd.read_csv(self.seq_df_path)
-        velocities = []
-        for seq_num in np.arange(seq_df.shape[0]):
-            lndks = coord_df.loc[coord_df['0'] == seq_num].values
-            lndks = lndks[:, 2:]
-            nose_tip_x = lndks[:, 30]
-            nose_tip_y = lndks[:, 30 + self.num_lndks]
-            offset = np.hstack((np.repeat(nose_tip_x.reshape(-1, 1), self.num_lndks, axis=1),
-                                np.repeat(nose_tip_y.reshape(-1, 1), self.num_lndks, axis=1)))
-            lndks_centered = lndks - offset
-            lndk_vel = np.power(np.power(lndks_centered[0:lndks_centered.shape[0] - 1, 0:self.num_lndks] -
-                                         lndks_centered[1:lndks_centered.shape[0], 0:self.num_lndks], 2) +
-                                np.power(lndks_centered[0:lndks_centered.shape[0] - 1, self.num_lndks:] -
-                                         lndks_centered[1:lndks_centered.shape[0], self.num_lndks:], 2),
-                                0.5)
-            data_velocities = []
-            for k in np.arange(1, lndk_vel.shape[0]):
-                data_velocities.append(np.array(lndk_vel[k, self.selected_lndks_idx]))
-            velocities.append(np.array(data_velocities))
-        return velocities
-
-    def __scale_features(self, velocities):
+        # A stable sort keeps the order of the frames inside each sequence
+        # The coordinates are kept in double precision: the differences between frames of almost still landmarks
+        # would lose most of their digits in float32
+        frames = self._coord_df.sort_values('0', kind='stable').to_numpy(dtype=np.float64)
+        seq_boundaries = np.searchsorted(frames[:, 0], np.arange(self._seq_df.shape[0] + 1))
+        seq_starts, seq_ends = seq_boundaries[:-1], seq_boundaries[1:]
+        seq_lengths = seq_ends - seq_starts
+        coords = np.ascontiguousarray(frames[:, 2:])
+        vel_offsets = np.zeros(self._seq_df.shape[0] + 1, dtype=np.int32)
+        np.cumsum(np.maximum(seq_lengths - 2, 0), out=vel_offsets[1:])
+        lndks_vel = np.empty(shape=(vel_offsets[-1], self._sel_idx.shape[0]), dtype=np.float32)
+        _velocities_kernel(coords, seq_starts, seq_ends, self._sel_idx, self._sel_idx_y, 30, 30 + self.num_lndks,
+                           lndks_vel, vel_offsets[:-1])
+        return lndks_vel, vel_offsets
+
+    def __get_train_frames_features(self, dtype=np.float32):
+        """
+        Collect the velocities of the frames of the training videos in a single contiguous array.
+        Return a 2D array of type dtype with the velocities of a training frame in each row
+        """
+
+        train_videos = [self._vel_flat[self._vel_offsets[i]:self._vel_offsets[i + 1]] for i in self.train_video_idx]
+        train_frames_features = np.empty(shape=(sum(video.shape[0] for video in train_videos), self._vel_flat.shape[1]),
+                                         dtype=dtype)
+        return np.concatenate(train_videos, axis=0, out=train_frames_features)
+
+    @staticmethod
+    def __new_scaler():
+        """
+        Return the scaler (not fitted) of the velocities
+        """
+
+        return RobustScaler(copy=False)
+
+    def __scale_features(self):
         """
         Scaling the features using RobustScaler. It makes features more robust than the outliers
         """
 
         if self.verbose:
             print("---- Scaling the features... ----")
-        train_velocities = [velocities[i] for i in self.train_video_idx]
-        features_train_frames = np.array([feature_frame for feature_video in train_velocities for feature_frame in feature_video])
-        features_all_frames = np.array([feature_frame for feature_video in velocities for feature_frame in feature_video])
-        features_all_frames = RobustScaler().fit(features_train_frames).transform(features_all_frames)
-        feat_count = 0
-        for video_idx, feature_video in enumerate(velocities):
-            for frame_idx, feature_frame_idx in enumerate(feature_video):
-                velocities[video_idx][frame_idx][:] = features_all_frames[feat_count]
-                feat_count += 1
-        return velocities
-
-    def __prepare_training_features(self, velocities):
+        scaler = self.__new_scaler().fit(self.__get_train_frames_features())
+        return np.ascontiguousarray(scaler.transform(self._vel_flat), dtype=np.float32)
+
+    def __prepare_training_features(self):
         """
         Prepare features for GMM training.
         All velocities of the sequences frame are inserted in a 4D array that contains all frames informations.
@@ -89,17 +252,10 @@ class PreliminaryClustering:
 
         if self.verbose:
             print("---- Preparing features vector of the frame in the training set by velocities... ----")
-        train_velocities = [velocities[i] for i in self.train_video_idx]
-        train_num_frames = sum([video.shape[0] for video in train_velocities])
-        n_features_for_frame = len(self.selected_lndks_idx)
-        train_frames_features = np.ndarray(shape=(1, train_num_frames, 1, n_features_for_frame))
-        index_frame = 0
-        for video_idx in self.train_video_idx:
-            video = velocities[video_idx]
-            for frame_idx in np.arange(video.shape[0]):
-                current_frame_features = video[frame_idx]
-                train_frames_features[0][index_frame][0][:] = current_frame_features[:]
-                index_frame += 1
+        # The GMM is fitted in double precision: float32 features make the EM covariances collapse
+        train_frames_features = self.__get_train_frames_features(dtype=np.float64)
+        train_frames_features = train_frames_features.reshape(1, train_frames_features.shape[0], 1,
+                                                              train_frames_features.shape[1])
         return train_frames_features
 
     def __generate_gmm(self, train_frames_features):
@@ -111,33 +267,71 @@ class PreliminaryClustering:
         if self.fit_by_bic:
             if self.verbose:
                 print("---- Generate GMM with fitting by BIC... ----")
-            gmm = FisherVectorGMM(covariance_type=self.covariance_type).fit_by_bic(
+            return FisherVectorGMM(covariance_type=self.covariance_type).fit_by_bic(
                 X=train_frames_features, choices_n_kernels=self.n_kernels, verbose=self.verbose)
-            n_kernels_current_GMM = len(gmm.means)
-            if self.fit_by_bic and isinstance(self.threshold_neutral, list):
-                self.threshold_neutral = self.threshold_neutral[self.n_kernels.index(n_kernels_current_GMM)]
-            self.n_kernels = n_kernels_current_GMM
-            return gmm
         else:
             if self.verbose:
                 print("---- Generate GMM with " + str(self.n_kernels) + " kernels... ----")
             return FisherVectorGMM(n_kernels=self.n_kernels, covariance_type=self.covariance_type).fit(
                 X=train_frames_features, verbose=False)
 
-    def __calculate_FV(self, velocities):
+    def __get_scaled_velocities(self, cache_key=None):
+        """
+        Get the scaled velocities of the frames in dataset, reading them from the cache if they were already saved
+        with the given key (the velocities calculated are saved in the cache if a key is passed).
+        Return the 2D array of the scaled velocities and the offsets of the frames of each sequence in its rows
         """
-        Calculate the fisher vectors of the first num test videos of the dataset.
-        Return the calculated fisher vectors
+
+        if cache_key is not None:
+            vel_cache_path = os.path.join(self.cache_dir, cache_key + "_vel.npy")
+            offsets_cache_path = os.path.join(self.cache_dir, cache_key + "_vel_offsets.npy")
+            if os.path.isfile(vel_cache_path) and os.path.isfile(offsets_cache_path):
+                if self.verbose:
+                    print("---- Read scaled velocities of the frames from cache... ----")
+                return np.load(vel_cache_path, mmap_mode='r'), np.load(offsets_cache_path)
+        self._vel_flat, self._vel_offsets = self.__get_velocities_frames()
+        self._vel_flat = self.__scale_features()
+        if cache_key is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # The velocities file is written last: its presence marks the entry of the cache as complete
+            self.__write_cache_file(offsets_cache_path, lambda f: np.save(f, self._vel_offsets))
+            self.__write_cache_file(vel_cache_path, lambda f: np.save(f, self._vel_flat))
+        return self._vel_flat, self._vel_offsets
+
+    def __get_gmm(self, cache_key=None):
+        """
+        Get the GMM fitted on the training features, reading it from the cache if it was already saved with the
+        given key (the GMM fitted is saved in the cache if a key is passed).
+        Return the fitted GMM
+        """
+
+        if cache_key is not None:
+            gmm_cache_path = os.path.join(self.cache_dir, cache_key + "_gmm.joblib")
+            if os.path.isfile(gmm_cache_path):
+                if self.verbose:
+                    print("---- Read GMM from cache... ----")
+                return joblib.load(gmm_cache_path)
+        train_frames_features = self.__prepare_training_features()
+        gmm = self.__generate_gmm(train_frames_features)
+        if cache_key is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.__write_cache_file(gmm_cache_path, lambda f: joblib.dump(gmm, f))
+        return gmm
+
+    def __calculate_FV(self):
+        """
+        Calculate the fisher vectors of the frames of all videos of the dataset.
+        Return a 3D array with the calculated fisher vectors of all frames
         """
 
         if self.verbose:
             print("---- Calculate fisher vectors of video sequences in dataset... ----")
-        n_features_for_frame = len(self.selected_lndks_idx)
-        fisher_vectors = []
-        for feature in velocities:
-            fv = self.gmm.predict(np.array(feature).reshape(1, feature.shape[0], 1, n_features_for_frame))
-            fisher_vectors.append(fv)
-        return fisher_vectors
+        n_features_for_frame = self._sel_idx.shape[0]
+        # The velocities are reshaped (and the FV returned) as views, without copying them
+        assert self._vel_flat.dtype == np.float32 and self._vel_flat.flags['C_CONTIGUOUS']
+        fisher_vectors = self.gmm.predict(self._vel_flat.reshape(1, self._vel_flat.shape[0], 1, n_features_for_frame),
+                                          dtype=np.float32)
+        return fisher_vectors[0]
 
     def __generate_histograms(self):
         """
@@ -149,14 +343,11 @@ class PreliminaryClustering:
         if self.verbose:
             print("---- Generate histograms of video sequences... ----")
         histograms_of_videos = []
-        for video_fv in self.fisher_vectors:
-            current_video_fv = video_fv[0]
-            video_histogram = np.zeros(self.n_kernels)
-            for frame in current_video_fv:
-                for index_configuration in range(0, self.n_kernels):
-                    video_histogram[index_configuration] += sum(frame[index_configuration]) + \
-                                                            sum(frame[index_configuration + self.n_kernels])
-            video_histogram = video_histogram / sum(video_histogram)
+        for start, end in zip(self._vel_offsets[:-1], self._vel_offsets[1:]):
+            current_video_fv = self._fv_flat[start:end]
+            video_histogram = current_video_fv[:, :self.n_kernels, :].sum(axis=(0, 2), dtype=np.float32) + \
+                              current_video_fv[:, self.n_kernels:, :].sum(axis=(0, 2), dtype=np.float32)
+            video_histogram /= video_histogram.sum()
             histograms_of_videos.append(video_histogram)
         return histograms_of_videos
 
@@ -174,16 +365,11 @@ class PreliminaryClustering:
                     self.threshold_neutral) +")"
             output += "... ----"
             print(output)
-        seq_df = pd.read_csv(self.seq_df_path)
-        index_neutral_configurations = []
-        for seq_num in self.train_video_idx:
-            vas = seq_df.iloc[seq_num][1]
-            if vas == 0:
-                hist = self.histograms_of_videos[seq_num]
-                for j in np.arange(self.n_kernels):
-                    if hist[j] > self.threshold_neutral and j not in index_neutral_configurations:
-                        index_neutral_configurations.append(j)
-        index_relevant_configurations = [x for x in np.arange(self.n_kernels) if x not in index_neutral_configurations]
+        train_histograms = np.stack([self.histograms_of_videos[seq_num] for seq_num in self.train_video_idx])
+        train_vas = self._seq_df.iloc[self.train_video_idx, 1].to_numpy()
+        neutral_mask = (train_histograms[train_vas == 0] > self.threshold_neutral).any(axis=0)
+        index_neutral_configurations = np.flatnonzero(neutral_mask).tolist()
+        index_relevant_configurations = np.flatnonzero(~neutral_mask).tolist()
         return index_relevant_configurations, index_neutral_configurations
 
     def __plot_and_save_histograms(self, histo_figures_path):
@@ -194,14 +380,11 @@ class PreliminaryClustering:
 
         if self.verbose:
             print("---- Plot and save histograms... ----")
-        for idx, histo in enumerate(self.histograms_of_videos):
-            if len(self.index_neutral_configurations):
-                plt.bar(self.index_neutral_configurations, histo[np.array(self.index_neutral_configurations)], color="blue")
-            if len(self.index_relevant_configurations):
-                plt.bar(self.index_relevant_configurations, histo[np.array(self.index_relevant_configurations)],color="red")
-            plt.title("VIDEO #" + str(idx))
-            plt.savefig(histo_figures_path + 'video-%03d.png' % idx, dpi=200)
-            plt.close()
+        tasks = [(idx, histo, self.index_neutral_configurations, self.index_relevant_configurations,
+                  histo_figures_path + 'video-%03d.png' % idx) for idx, histo in enumerate(self.histograms_of_videos)]
+        # Workers are spawned since forking the process after the numba threading layer is started is not safe
+        with ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn')) as executor:
+            list(executor.map(_render_one, tasks, chunksize=8))
 
     def execute_preliminary_clustering(self, preliminary_clustering_dump_path=None,
                                        histo_figures_path=None):
@@ -210,11 +393,15 @@ class PreliminaryClustering:
         If plot_and_save_histo is setted on True value the figures of histograms of videos is saved in files
         """
 
-        velocities = self.__get_velocities_frames()
-        velocities_scaled = self.__scale_features(velocities)
-        train_frames_features = self.__prepare_training_features(velocities_scaled)
-        self.gmm = self.__generate_gmm(train_frames_features)
-        self.fisher_vectors = self.__calculate_FV(velocities_scaled)
+        vel_cache_key, gmm_cache_key = self.__get_cache_keys() if self.cache_dir is not None else (None, None)
+        self._vel_flat, self._vel_offsets = self.__get_scaled_velocities(vel_cache_key)
+        self.gmm = self.__get_gmm(gmm_cache_key)
+        if self.fit_by_bic:
+            n_kernels_current_GMM = len(self.gmm.means)
+            if isinstance(self.threshold_neutral, list):
+                self.threshold_neutral = self.threshold_neutral[self.n_kernels.index(n_kernels_current_GMM)]
+            self.n_kernels = n_kernels_current_GMM
+        self._fv_flat = self.__calculate_FV()
         self.histograms_of_videos = self.__generate_histograms()
         self.index_relevant_configurations, self.index_neutral_configurations = \
             self.__extract_relevant_and_neutral_configurations()
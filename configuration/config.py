@@ -20,6 +20,10 @@ selected_lndks_idx = [5, 11, 19, 24, 37, 41, 44, 46, 50, 52, 56, 58]
 
 n_jobs = 4  # Number of threads to use to perform SVR training
 
+# Directory where the scaled velocities and the fitted GMM of the preliminary clustering are cached between executions
+cache_dir = "data/cache/"
+"""Set cache_dir = None to disable the cache"""
+
 # Type of protocol to be used to evaluate the performance of the models
 cross_val_protocol = "5-fold-cross-validation"
 """cross_val_protocol:  'Leave-One-Subject-Out' or '5-fold-cross-validation' or 'Leave-One-Sequence-Out'"""
@@ -46,6 +46,7 @@ path_confusion_matrices = path_results + "confusion_matrices/"
 path_results_csv = path_results + "results.csv"
 path_conf_matrix_csv = path_results + "confusion_matrix.csv"
 n_jobs = config.n_jobs
+cache_dir = config.cache_dir
 
 if __name__ == '__main__':
     dir_paths = [path_results, path_errors, path_confusion_matrices, path_gmm_means]
@@ -78,7 +79,8 @@ if __name__ == '__main__':
                                                        n_kernels=n_kernels_GMM,
                                                        covariance_type=covariance_type,
                                                        threshold_neutral=threshold_neutral,
-                                                       fit_by_bic=fit_by_bic)
+                                                       fit_by_bic=fit_by_bic,
+                                                       cache_dir=cache_dir)
         if save_histo_figures == True:
             path_histo_current = path_histo_figures + "test_"+str(test_idx)+"_"
         preliminary_clustering.execute_preliminary_clustering(histo_figures_path=path_histo_current)
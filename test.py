@@ -40,6 +40,7 @@ path_result = "data/test/" + sub_directory
 path_cm = path_result + "confusion_matrices/"
 path_result_thresholds = path_result + "scores_thresholds.csv"
 n_jobs = config.n_jobs
+cache_dir = config.cache_dir
 
 """The procedure is performed which involves performing preliminary clustering and subsequent generation 
 of SVR given the number of kernels of the GMM and the threshold for the neutral configurations
@@ -84,7 +85,8 @@ def compare_performance_with_different_thresholds():
                                                                covariance_type=covariance_type,
                                                                verbose=False,
                                                                threshold_neutral=threshold,
-                                                               fit_by_bic=fit_by_bic)
+                                                               fit_by_bic=fit_by_bic,
+                                                               cache_dir=cache_dir)
                 preliminary_clustering.execute_preliminary_clustering()
                 if len(preliminary_clustering.index_relevant_configurations) > 0:
                     current_error, current_cm = generate_and_test_model(
@@ -164,7 +166,8 @@ def compare_performance_different_thresholds_by_BIC():
                                                            covariance_type=covariance_type,
                                                            verbose=False,
                                                            threshold_neutral=threshold,
-                                                           fit_by_bic=config.fit_by_bic)
+                                                           fit_by_bic=config.fit_by_bic,
+                                                           cache_dir=cache_dir)
             preliminary_clustering.execute_preliminary_clustering()
             n_kernels_current_GMM = preliminary_clustering.n_kernels
             num_relevant_config = len(preliminary_clustering.index_relevant_configurations)